@@ -1,18 +1,21 @@
 # app_simple.py
 
 import streamlit as st
-import os
 from pathlib import Path
+import hashlib
 from backend import (
     get_llm_chain, 
     get_test_case_generation_chain, 
-    parse_test_cases_from_response, 
-    create_excel_file
+    split_document,
+    batch_test_case_chain,
+    parse_test_case_responses, 
+    create_excel_file,
+    iter_pdf_pages_text
 )
 import docx
-from pypdf import PdfReader
 import io
 from datetime import datetime
+from functools import partial
 import logging
 
 # Configure logging
@@ -215,36 +218,50 @@ def add_custom_styling():
     """, unsafe_allow_html=True)
 
 # --- TEXT EXTRACTION ---
-def extract_text_from_file(uploaded_file):
-    logger.info(f"Starting text extraction from file: {uploaded_file.name}")
-    if uploaded_file is None: 
+SUPPORTED_EXTENSIONS = ("pdf", "docx", "txt")
+# Most documents kept in the extracted-text cache, shared by all sessions
+EXTRACT_CACHE_MAX_ENTRIES = 32
+
+def fingerprint_document(file_bytes):
+    return hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+
+@st.cache_data(show_spinner=False, max_entries=EXTRACT_CACHE_MAX_ENTRIES)
+def _extract_cached(_file_bytes, file_extension, document_fp):
+    # Keyed on the content fingerprint rather than the raw bytes, so
+    # re-uploading the same document in any session skips the parse entirely
+    # without Streamlit re-hashing the whole file.
+    if file_extension == "pdf":
+        logger.info("Processing PDF file")
+        parts = list(iter_pdf_pages_text(_file_bytes))
+        text = "".join(parts)
+        logger.info("Extracted %d pages, %d chars", len(parts), len(text))
+        return text
+    elif file_extension == "docx":
+        logger.info("Processing DOCX file")
+        doc = docx.Document(io.BytesIO(_file_bytes))
+        paragraphs = doc.paragraphs
+        logger.info(f"Extracted {len(paragraphs)} paragraphs from DOCX")
+        return "\n".join(para.text for para in paragraphs)
+    else:
+        logger.info("Processing TXT file")
+        # The bytes are already in memory, so decoding them directly is the
+        # only copy; re-reading the upload would add another.
+        return _file_bytes.decode("utf-8")
+
+def extract_text_from_file(file_name, file_bytes, document_fp):
+    logger.info(f"Starting text extraction from file: {file_name}")
+    if file_bytes is None: 
         logger.warning("No file uploaded")
         return None
     
-    file_extension = uploaded_file.name.split('.')[-1].lower()
-    text = ""
+    file_extension = file_name.split('.')[-1].lower()
+    if file_extension not in SUPPORTED_EXTENSIONS:
+        logger.error(f"Unsupported file type: .{file_extension}")
+        st.error(f"Unsupported file type: .{file_extension}")
+        return None
     
     try:
-        if file_extension == "pdf":
-            logger.info("Processing PDF file")
-            pdf_reader = PdfReader(io.BytesIO(uploaded_file.getvalue()))
-            for i, page in enumerate(pdf_reader.pages):
-                text += page.extract_text() or ""
-                logger.info(f"Extracted text from page {i+1}")
-        elif file_extension == "docx":
-            logger.info("Processing DOCX file")
-            doc = docx.Document(io.BytesIO(uploaded_file.getvalue()))
-            for i, para in enumerate(doc.paragraphs):
-                text += para.text + "\n"
-            logger.info(f"Extracted {i+1} paragraphs from DOCX")
-        elif file_extension == "txt":
-            logger.info("Processing TXT file")
-            text = uploaded_file.getvalue().decode("utf-8")
-        else:
-            logger.error(f"Unsupported file type: .{file_extension}")
-            st.error(f"Unsupported file type: .{file_extension}")
-            return None
-        
+        text = _extract_cached(file_bytes, file_extension, document_fp)
         logger.info(f"Successfully extracted {len(text)} characters")
         return text
     except Exception as e:
@@ -252,23 +269,41 @@ def extract_text_from_file(uploaded_file):
         st.error(f"Error processing file: {e}")
         return None
 
+# --- CHAT HISTORY ---
+def add_chat_message(role, content):
+    # Keep the prompt-ready history string in step with the message list so
+    # each turn appends to it instead of rebuilding it from every message.
+    st.session_state.chat_messages.append({"role": role, "content": content})
+    speaker = "User" if role == "user" else "Assistant"
+    st.session_state.chat_history_str += f"{speaker}: {content}\n\n"
+
 # --- MAIN APP ---
 st.set_page_config(page_title="AI Test Case Generator", layout="wide", initial_sidebar_state="collapsed")
+# Must run on every rerun: Streamlit removes any element a run doesn't
+# re-emit, so gating this per session would drop the styles after the
+# first interaction. Unchanged elements are not re-rendered by the browser.
 add_custom_styling()
 
 logger.info("Application started")
 
 # Header with logo
 BASE_DIR = Path(__file__).parent
+
+@st.cache_data
+def _logo_path_or_none():
+    # The logo doesn't change while the process runs, so stat it only once
+    logo_path = BASE_DIR / "logo_main.png"
+    return str(logo_path) if logo_path.exists() else None
+
 col_logo, col_title = st.columns([1, 4])
 with col_logo:
-    logo_path = os.path.join(BASE_DIR, "logo_main.png")
+    logo_path = _logo_path_or_none()
     
-    if os.path.exists(logo_path):
+    if logo_path:
         st.image(logo_path, width=180)
         logger.info("Logo loaded successfully")
     else:
-        logger.warning(f"Logo not found at {logo_path}")
+        logger.warning(f"Logo not found at {BASE_DIR / 'logo_main.png'}")
         st.warning("Logo image not found")
 
 with col_title:
@@ -278,15 +313,18 @@ with col_title:
 if "document_context" not in st.session_state:
     st.session_state.document_context = None
     st.session_state.document_name = None
+    st.session_state.document_fp = None
+    st.session_state.document_file_id = None
     logger.info("Initialized document session state")
 if "generated_test_cases" not in st.session_state:
     st.session_state.generated_test_cases = None
+    st.session_state.test_case_metrics = None
+    st.session_state.excel_filename = None
     logger.info("Initialized test cases session state")
 if "chat_messages" not in st.session_state:
     st.session_state.chat_messages = []
+    st.session_state.chat_history_str = ""
     logger.info("Initialized chat session state")
-if "excel_data" not in st.session_state:
-    st.session_state.excel_data = None
 
 # Load chains
 @st.cache_resource
@@ -304,6 +342,24 @@ def load_chains():
 
 general_chain, test_case_chain = load_chains()
 
+# Generated test cases are shared by all sessions; bound how many documents'
+# results are kept and for how long
+GENERATION_CACHE_MAX_ENTRIES = 16
+GENERATION_CACHE_TTL = "1d"
+
+@st.cache_data(show_spinner=False, ttl=GENERATION_CACHE_TTL, max_entries=GENERATION_CACHE_MAX_ENTRIES)
+def generate_test_cases(_context, document_fp):
+    # Keyed on the document fingerprint, so the same document is only sent to
+    # the LLM once across sessions.
+    chunks = split_document(_context)
+    logger.info(f"Invoking test case generation chain on {len(chunks)} chunks")
+    responses = batch_test_case_chain(test_case_chain, chunks)
+    logger.info(f"Received {len(responses)} responses from AI")
+    
+    test_cases_df = parse_test_case_responses(responses)
+    logger.info(f"Parsed {len(test_cases_df)} test cases")
+    return test_cases_df
+
 # Create 2x2 grid - TOP ROW
 col1, col2 = st.columns(2, gap="small")
 
@@ -313,23 +369,53 @@ with col1:
     
     uploaded_file = st.file_uploader(
         "Document",
-        type=["pdf", "docx", "txt"],
+        type=list(SUPPORTED_EXTENSIONS),
         label_visibility="collapsed"
     )
     
     if uploaded_file:
-        if st.session_state.document_name != uploaded_file.name:
-            logger.info(f"New file uploaded: {uploaded_file.name}")
-            with st.spinner("📄 Processing..."):
-                extracted_text = extract_text_from_file(uploaded_file)
-                if extracted_text:
-                    st.session_state.document_context = extracted_text
-                    st.session_state.document_name = uploaded_file.name
-                    st.session_state.generated_test_cases = None
-                    st.session_state.excel_data = None
-                    st.session_state.chat_messages = []
-                    logger.info(f"Document processed: {len(extracted_text)} chars")
-                    st.success(f"✅ {uploaded_file.name[:30]}")
+        # Only fingerprint each upload once, not on every rerun; the file id is
+        # recorded only once the upload is usable, so failures are retried
+        if st.session_state.document_file_id != uploaded_file.file_id:
+            # Read the upload once; the same bytes feed the fingerprint and the parser
+            file_bytes = uploaded_file.getvalue()
+            document_fp = fingerprint_document(file_bytes)
+            
+            if st.session_state.document_fp != document_fp:
+                logger.info(f"New file uploaded: {uploaded_file.name}")
+                with st.spinner("📄 Processing..."):
+                    extracted_text = extract_text_from_file(uploaded_file.name, file_bytes, document_fp)
+                    if extracted_text:
+                        st.session_state.document_file_id = uploaded_file.file_id
+                        st.session_state.document_context = extracted_text
+                        st.session_state.document_name = uploaded_file.name
+                        st.session_state.document_fp = document_fp
+                        st.session_state.generated_test_cases = None
+                        st.session_state.test_case_metrics = None
+                        st.session_state.excel_filename = None
+                        st.session_state.chat_messages = []
+                        st.session_state.chat_history_str = ""
+                        logger.info(f"Document processed: {len(extracted_text)} chars")
+                        st.success(f"✅ {uploaded_file.name[:30]}")
+                    else:
+                        # Don't leave Generate working on the previous document
+                        st.session_state.document_context = None
+                        st.session_state.document_name = None
+                        st.session_state.document_fp = None
+                        st.session_state.generated_test_cases = None
+                        st.session_state.test_case_metrics = None
+                        st.session_state.excel_filename = None
+                        if extracted_text == "":
+                            st.error("No text could be extracted from this document")
+            else:
+                # Same content under another name: keep the existing results
+                logger.info(f"Unchanged content re-uploaded as {uploaded_file.name}")
+                st.session_state.document_file_id = uploaded_file.file_id
+                st.session_state.document_name = uploaded_file.name
+                if st.session_state.generated_test_cases is not None:
+                    # The download should carry the name the document has now
+                    doc_name = Path(uploaded_file.name).stem
+                    st.session_state.excel_filename = f"TestCases_{doc_name}_{datetime.now():%Y%m%d_%H%M%S}.xlsx"
         
         if st.session_state.document_name:
             if st.button("🚀 Generate", type="primary", use_container_width=True):
@@ -339,36 +425,34 @@ with col1:
                     status_placeholder = st.empty()
                     
                     try:
-                        # Step 1: Processing
-                        status_placeholder.info("📄 Processing...")
-                        logger.info("Processing document")
-                        import time
-                        time.sleep(0.5)
-                        
-                        # Step 2: Understanding
                         status_placeholder.info("🧠 Understanding...")
-                        logger.info("Invoking test case generation chain")
-                        response = test_case_chain.invoke({
-                            "context": st.session_state.document_context, 
-                            "query": "Generate comprehensive test cases"
-                        })
-                        logger.info("Received response from AI")
-                        
-                        # Step 3: Generating
-                        status_placeholder.info("⚙️ Generating...")
-                        test_cases_df = parse_test_cases_from_response(response)
-                        logger.info(f"Parsed {len(test_cases_df)} test cases")
+                        logger.info("Processing document")
+                        test_cases_df = generate_test_cases(
+                            st.session_state.document_context,
+                            st.session_state.document_fp
+                        )
+                        if test_cases_df.attrs.get('parse_fallback'):
+                            # Don't replay a bad LLM reply; the next Generate asks again
+                            logger.warning("Some requests failed or could not be parsed; not caching the result")
+                            generate_test_cases.clear(
+                                st.session_state.document_context,
+                                st.session_state.document_fp
+                            )
                         st.session_state.generated_test_cases = test_cases_df
+                        # Computed once here rather than on every rerun of the Download box
+                        st.session_state.test_case_metrics = (
+                            len(test_cases_df),
+                            (test_cases_df['Priority'] == 'High').sum(),
+                            test_cases_df['Module/Feature'].nunique()
+                        )
+                        doc_name = Path(st.session_state.document_name).stem
+                        st.session_state.excel_filename = f"TestCases_{doc_name}_{datetime.now():%Y%m%d_%H%M%S}.xlsx"
                         
-                        # Step 4: Creating Excel
-                        status_placeholder.info("📊 Creating...")
-                        excel_data = create_excel_file(test_cases_df)
-                        logger.info(f"Created Excel file: {len(excel_data)} bytes")
-                        st.session_state.excel_data = excel_data
-                        
-                        # Step 5: Done
-                        status_placeholder.success(f"✅ Done! {len(test_cases_df)} cases")
-                        time.sleep(1)
+                        # Non-blocking confirmation that survives the rerun below
+                        if test_cases_df.attrs.get('parse_fallback'):
+                            st.toast(f"⚠️ {len(test_cases_df)} cases, some sections failed")
+                        else:
+                            st.toast(f"✅ Done! {len(test_cases_df)} cases")
                         status_placeholder.empty()
                         st.rerun()
                         
@@ -387,42 +471,34 @@ with col2:
     
     if st.session_state.generated_test_cases is not None:
         logger.info("Displaying test case statistics")
-        total_cases = len(st.session_state.generated_test_cases)
+        total_cases, high_count, modules = st.session_state.test_case_metrics
         
         col_a, col_b, col_c = st.columns(3)
         with col_a:
             st.metric("Total", total_cases)
         with col_b:
-            try:
-                high_count = (st.session_state.generated_test_cases['Priority'] == 'High').sum()
-                st.metric("High", high_count)
-            except:
-                st.metric("High", "-")
+            st.metric("High", high_count)
         with col_c:
-            try:
-                modules = st.session_state.generated_test_cases['Module'].nunique()
-                st.metric("Modules", modules)
-            except:
-                st.metric("Modules", "-")
+            st.metric("Modules", modules)
         
-        if st.session_state.excel_data:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            doc_name = st.session_state.document_name.split('.')[0]
-            filename = f"TestCases_{doc_name}_{timestamp}.xlsx"
-            
-            logger.info(f"Excel ready for download: {filename}")
-            
-            st.download_button(
-                label="📥 Download Excel",
-                data=st.session_state.excel_data,
-                file_name=filename,
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                type="primary",
-                use_container_width=True
-            )
-            
-            st.success(f"✅ Ready")
+        filename = st.session_state.excel_filename
+        logger.info(f"Excel ready for download: {filename}")
+        
+        # The workbook is only built when the user actually downloads it
+        st.download_button(
+            label="📥 Download Excel",
+            data=partial(create_excel_file, st.session_state.generated_test_cases),
+            file_name=filename,
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            type="primary",
+            use_container_width=True
+        )
         
+        if st.session_state.generated_test_cases.attrs.get('parse_fallback'):
+            st.warning("⚠️ Some sections of the document failed to generate; click Generate to retry")
+        else:
+            st.success(f"✅ Ready")
+    
         with st.expander("👁️ Preview", expanded=False):
             # Show only top 5 test cases in preview
             preview_df = st.session_state.generated_test_cases.head(5)
@@ -445,12 +521,12 @@ with col2:
         st.info("📊 Results appear here")
 
 # BOTTOM ROW - CHAT (Only visible after Excel is ready for download)
-if st.session_state.excel_data is not None:
+if st.session_state.generated_test_cases is not None:
     st.markdown("## 💬 Chat")
     
     if not st.session_state.chat_messages:
         welcome = "👋 Ask me anything about your document! I remember our conversation."
-        st.session_state.chat_messages.append({"role": "assistant", "content": welcome})
+        add_chat_message("assistant", welcome)
         logger.info("Initialized chat")
     
     # Display all messages
@@ -462,8 +538,11 @@ if st.session_state.excel_data is not None:
     if user_input := st.chat_input("Ask question...", disabled=not st.session_state.document_context):
         logger.info(f"User input: {user_input}")
         
+        # History sent to the LLM excludes the current message
+        chat_history = st.session_state.chat_history_str
+        
         # Add user message and display it immediately
-        st.session_state.chat_messages.append({"role": "user", "content": user_input})
+        add_chat_message("user", user_input)
         with st.chat_message("user"):
             st.markdown(user_input)
         
@@ -473,29 +552,24 @@ if st.session_state.excel_data is not None:
                 try:
                     logger.info("Invoking general chain for chat")
                     if general_chain and st.session_state.document_context:
-                        # Build chat history string from previous messages
-                        chat_history = ""
-                        for msg in st.session_state.chat_messages[:-1]:  # Exclude current message
-                            role = "User" if msg["role"] == "user" else "Assistant"
-                            chat_history += f"{role}: {msg['content']}\n\n"
-                        
-                        response = general_chain.invoke({
+                        # Render tokens as they arrive; write_stream returns the full text
+                        response = st.write_stream(general_chain.stream({
                             "context": st.session_state.document_context,
                             "chat_history": chat_history,
                             "query": user_input
-                        })
+                        }))
                         logger.info("Received chat response")
                     else:
                         response = "Upload document first."
                         logger.warning("Chat attempted without document")
+                        st.markdown(response)
                     
-                    st.markdown(response)
-                    st.session_state.chat_messages.append({"role": "assistant", "content": response})
+                    add_chat_message("assistant", response)
                     
                 except Exception as e:
                     logger.error(f"Chat error: {e}", exc_info=True)
                     error_msg = f"❌ Error: {str(e)}"
                     st.error(error_msg)
-                    st.session_state.chat_messages.append({"role": "assistant", "content": error_msg})
+                    add_chat_message("assistant", error_msg)
 
 logger.info("Page render complete")
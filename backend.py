@@ -1,21 +1,116 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_groq import ChatGroq
 from dotenv import load_dotenv
 import os
+import httpx
 
+import numpy as np
 import pandas as pd
 import json
 import re
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from datetime import datetime
 import io
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from functools import lru_cache
+from pypdf import PdfReader
+from pdf_worker import init_pdf_worker, extract_page_text
 
+load_dotenv()
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+# PDFs with fewer pages than this are extracted in-process; the worker pool
+# startup cost outweighs the gain on small documents.
+PDF_PARALLEL_MIN_PAGES = 4
+
+# Upper bound on concurrent requests when a chain is run over several inputs.
+LLM_MAX_CONCURRENCY = 8
+
+# Per-request timeout in seconds and retry count for Groq API calls, so a
+# stalled request fails instead of hanging the app.
+LLM_REQUEST_TIMEOUT = 120
+LLM_MAX_RETRIES = 2
+
+# Documents longer than this many characters are split and sent to the test
+# case chain as separate prompts; the overlap keeps scenarios that straddle a
+# boundary intact in at least one chunk.
+CONTEXT_CHUNK_SIZE = 12000
+CONTEXT_CHUNK_OVERLAP = 500
+
+# Test steps matching this need visual confirmation in the Excel output
+_VERIFY_RE = re.compile(
+    r'verify|check|confirm|validate|ensure|displayed|appears|shown|visible',
+    re.IGNORECASE
+)
+
+# Characters that can change bracket depth or string state while scanning JSON
+_JSON_STRUCTURE_RE = re.compile(r'["\\\[\]]')
+
+# LLM field name -> DataFrame/Excel column name, in output column order
+_FIELD_MAP = {
+    'test_case_id': 'Test Case ID',
+    'title': 'Test Case Title', 
+    'description': 'Description',
+    'preconditions': 'Preconditions',
+    'test_steps': 'Test Steps',
+    'expected_result': 'Expected Result',
+    'test_data': 'Test Data',
+    'module': 'Module/Feature',
+    'priority': 'Priority'
+}
+_FINAL_COLUMNS = list(_FIELD_MAP.values())
+
+# Cell formats of the Test Cases sheet; Format objects belong to a single
+# workbook, so each export builds them from these descriptions
+_HEADER_FMT_DICT = {
+    'bold': True,
+    'bg_color': '#0055a4',
+    'font_color': 'white',
+    'border': 1,
+    'align': 'center',
+    'valign': 'vcenter',
+    'text_wrap': True
+}
+_CELL_FMT_DICT = {
+    'border': 1,
+    'align': 'left',
+    'valign': 'top',
+    'text_wrap': True
+}
+_STEP_FMT_DICT = {
+    'border': 1,
+    'align': 'center',
+    'valign': 'vcenter',
+    'bold': True
+}
+
+# Widths of the Test Cases sheet columns, in order: Test Case ID, Test Case
+# Title, Description, Preconditions, Step Number, Test Step, Expected Result,
+# Screenshot, Test Data
+_COLUMN_WIDTHS = [15, 35, 40, 35, 10, 60, 40, 20, 30]
+
+@lru_cache(maxsize=1)
+def _get_http_client():
+    """
+    Returns the HTTP client shared by every ChatGroq instance, so connections
+    to the Groq API are kept alive and reused across requests and chains.
+    """
+    return httpx.Client(
+        limits=httpx.Limits(max_keepalive_connections=16, keepalive_expiry=60)
+    )
+
+@lru_cache(maxsize=1)
 def get_llm_chain():
     """
     Creates and returns a LangChain chain that is context-aware with chat history.
+    The chain is built once and the same instance is returned on later calls.
     """
-    load_dotenv()
-    
     prompt_template = ChatPromptTemplate.from_messages([
         ("system", """
         You are an expert AI analyst. Answer the user's query based on the context and chat history provided below.
@@ -33,19 +128,22 @@ def get_llm_chain():
     llm = ChatGroq(
         model="llama-3.3-70b-versatile",
         temperature=0.2,
-        api_key=os.getenv("GROQ_API_KEY")
+        api_key=GROQ_API_KEY,
+        timeout=LLM_REQUEST_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        http_client=_get_http_client()
     )
     output_parser = StrOutputParser()
     chain = prompt_template | llm | output_parser
     
     return chain
 
+@lru_cache(maxsize=1)
 def get_test_case_generation_chain():
     """
     Creates a specialized chain for generating test cases from client transcripts.
+    The chain is built once and the same instance is returned on later calls.
     """
-    load_dotenv()
-    
     prompt_template = ChatPromptTemplate.from_messages([
         ("system", """
         You are an expert test case analyst and test script writer. Analyze the provided client transcript/discussion and generate comprehensive test cases with 
@@ -80,7 +178,7 @@ def get_test_case_generation_chain():
         - Description should explain the complete scenario, not just a summary
         - When a test step requires visual confirmation or validation of UI elements/screens/displays, add "**Add screenshot here" in the expected_result field for that specific step
         
-        IMPORTANT: You must respond with a valid JSON array containing test case objects. Each test case object must have these exact fields:
+        IMPORTANT: You must respond with a valid JSON object with a single key "test_cases" whose value is an array of test case objects. Each test case object must have these exact fields:
         - test_case_id: string (e.g., "TC001")
         - title: string (descriptive and specific)
         - description: string (comprehensive explanation of what is being tested)
@@ -89,9 +187,10 @@ def get_test_case_generation_chain():
         - expected_result: string (detailed expected outcome)
         - test_data: string (specific data values with examples)
         - module: string (feature/module name)
+        - priority: string (High, Medium or Low)
         
         Example response format:
-        [
+        {{"test_cases": [
             {{
                 "test_case_id": "TC001",
                 "title": "Complete User Profile Setup with Account and Shipping Details in Ariba",
@@ -104,7 +203,7 @@ def get_test_case_generation_chain():
                 "test_type": "Functional",
                 "module": "User Profile Management"
             }}
-        ]
+        ]}}
         
         Generate multiple relevant test cases based on the context. Always respond with valid JSON only. REMEMBER: MAXIMUM DETAIL IS REQUIRED.
         
@@ -118,25 +217,164 @@ def get_test_case_generation_chain():
         model="llama-3.3-70b-versatile",
         temperature=0.1,
         max_tokens=9900,
-        api_key=os.getenv("GROQ_API_KEY")
+        model_kwargs={"response_format": {"type": "json_object"}},
+        api_key=GROQ_API_KEY,
+        timeout=LLM_REQUEST_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        http_client=_get_http_client()
     )
     output_parser = StrOutputParser()
     chain = prompt_template | llm | output_parser
     
     return chain
 
+def split_document(context):
+    """
+    Splits a document into chunks for the test case chain.
+    Splits prefer paragraph, then line, then word boundaries.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CONTEXT_CHUNK_SIZE,
+        chunk_overlap=CONTEXT_CHUNK_OVERLAP
+    )
+    return splitter.split_text(context) or [context]
+
+def batch_test_case_chain(chain, contexts, query="Generate comprehensive test cases"):
+    """
+    Runs the test case chain over several contexts in one batched call.
+    Returns the raw responses in the same order as the contexts; a request that
+    failed (rate limit, timeout, ...) leaves its exception in place so the other
+    chunks' responses are kept.
+    """
+    inputs = [{"context": context, "query": query} for context in contexts]
+    return chain.batch(
+        inputs,
+        config={"max_concurrency": LLM_MAX_CONCURRENCY},
+        return_exceptions=True
+    )
+
+def iter_pdf_pages_text(pdf_bytes):
+    """
+    Yields the text of each page of a PDF, in page order.
+    Larger documents are split across worker processes, one page per task,
+    so pages are yielded as soon as they are ready instead of after the whole
+    document has been extracted. Single-core hosts always extract in-process.
+    """
+    pdf_reader = PdfReader(io.BytesIO(pdf_bytes))
+    num_pages = len(pdf_reader.pages)
+    cpu_count = os.cpu_count() or 1
+    
+    if num_pages < PDF_PARALLEL_MIN_PAGES or cpu_count < 2:
+        for page in pdf_reader.pages:
+            yield page.extract_text() or ""
+        return
+    
+    max_workers = min(cpu_count, num_pages)
+    # Forking the multi-threaded Streamlit server can deadlock on locks held by
+    # other threads, so workers start from a clean interpreter instead
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=init_pdf_worker,
+        initargs=(pdf_bytes,)
+    ) as executor:
+        yield from executor.map(extract_page_text, range(num_pages))
+
+def _json_loads(json_str):
+    # orjson is several times faster on large responses; fall back to the
+    # standard library when it isn't installed. Both return plain dicts/lists.
+    if orjson is not None:
+        return orjson.loads(json_str)
+    return json.loads(json_str)
+
+def _find_top_array(text):
+    """
+    Returns the first complete top-level JSON array in text, or None.
+    Brackets inside JSON strings are ignored, so prose after the array
+    that contains ']' does not extend the match.
+    """
+    start = text.find('[')
+    if start == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    skip_to = -1
+    for match in _JSON_STRUCTURE_RE.finditer(text, start):
+        pos = match.start()
+        if pos < skip_to:
+            continue
+        ch = match.group()
+        if in_string:
+            if ch == '\\':
+                skip_to = pos + 2
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '[':
+            depth += 1
+        elif ch == ']':
+            depth -= 1
+            if depth == 0:
+                return text[start:pos + 1]
+    return None
+
+def _decode_test_cases_json(json_str):
+    # The LLM sometimes double-escapes newlines; undo that once on the
+    # raw JSON so the decoder yields real newlines in every field
+    if '\\\\n' in json_str:
+        json_str = json_str.replace('\\\\n', '\\n')
+    return _json_loads(json_str)
+
+def _join_list_field(value):
+    # Steps and other multi-line fields sometimes come back as a JSON array of lines
+    if isinstance(value, list):
+        return "\n".join(map(str, value))
+    return value
+
+def _as_category(values):
+    # The LLM occasionally returns a list or object for a label field;
+    # categories need hashable values, so stringify everything but missing values
+    return values.map(str, na_action='ignore').astype('category')
+
 def parse_test_cases_from_response(response_text):
     """
     Parse the LLM response and extract test cases data.
     Returns a pandas DataFrame suitable for Excel export.
+    When no test cases could be parsed, the placeholder frame returned instead
+    has df.attrs['parse_fallback'] set to True.
     """
     try:
         response_text = response_text.strip()
         
-        json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group()
-            test_cases = json.loads(json_str)
+        # JSON mode responses are a {"test_cases": [...]} object, though the
+        # model may pick another key or return a single test case; only scan
+        # for an embedded array when the response is not valid JSON on its own
+        test_cases = None
+        try:
+            decoded = _decode_test_cases_json(response_text)
+            if isinstance(decoded, dict):
+                test_cases = decoded.get('test_cases')
+                if test_cases is None and 'test_case_id' in decoded:
+                    test_cases = [decoded]
+                elif test_cases is None:
+                    test_cases = next(
+                        (value for value in decoded.values() if isinstance(value, list)),
+                        None
+                    )
+            elif isinstance(decoded, list):
+                test_cases = decoded
+        except ValueError:
+            pass
+        if test_cases is None:
+            json_str = _find_top_array(response_text)
+            if json_str:
+                test_cases = _decode_test_cases_json(json_str)
+        
+        parse_fallback = test_cases is None
+        if not parse_fallback:
             print(f"Successfully parsed {len(test_cases)} test cases from JSON")
         else:
             print("No JSON found, creating test cases from text content")
@@ -148,41 +386,23 @@ def parse_test_cases_from_response(response_text):
         if not isinstance(test_cases, list):
             test_cases = [test_cases]
         
-        # Convert escaped newlines to actual newlines in test_steps and preconditions
-        for test_case in test_cases:
-            if 'test_steps' in test_case and isinstance(test_case['test_steps'], str):
-                test_case['test_steps'] = test_case['test_steps'].replace('\\n', '\n')
-            if 'preconditions' in test_case and isinstance(test_case['preconditions'], str):
-                test_case['preconditions'] = test_case['preconditions'].replace('\\n', '\n')
-            if 'expected_result' in test_case and isinstance(test_case['expected_result'], str):
-                test_case['expected_result'] = test_case['expected_result'].replace('\\n', '\n')
-        
-        df = pd.DataFrame(test_cases)
-        
-        required_columns = {
-            'test_case_id': 'Test Case ID',
-            'title': 'Test Case Title', 
-            'description': 'Description',
-            'preconditions': 'Preconditions',
-            'test_steps': 'Test Steps',
-            'expected_result': 'Expected Result',
-            'test_data': 'Test Data',
-            'module': 'Module/Feature'
+        # Build each column in one pass so the DataFrame is allocated once
+        columns = {
+            new_col: [_join_list_field(test_case.get(old_col, "To be defined")) for test_case in test_cases]
+            for old_col, new_col in _FIELD_MAP.items()
         }
         
-        for old_col, new_col in required_columns.items():
-            if old_col not in df.columns:
-                df[old_col] = "To be defined"
-        
-        df = df.rename(columns=required_columns)
-        df = df[list(required_columns.values())]
+        df = pd.DataFrame(columns, columns=_FINAL_COLUMNS)
+        df['Priority'] = _as_category(df['Priority'])
+        df['Module/Feature'] = _as_category(df['Module/Feature'])
+        df.attrs['parse_fallback'] = parse_fallback
         
         print(f"Created DataFrame with {len(df)} rows")
         return df
         
     except Exception as e:
         print(f"Error in parse_test_cases_from_response: {e}")
-        return pd.DataFrame([{
+        error_df = pd.DataFrame([{
             'Test Case ID': 'TC001',
             'Test Case Title': 'Parsing Error',
             'Description': f'Error: {e}',
@@ -190,139 +410,168 @@ def parse_test_cases_from_response(response_text):
             'Test Steps': response_text[:500],
             'Expected Result': 'Successful generation after review',
             'Test Data': 'N/A',
-            'Module/Feature': 'System'
+            'Module/Feature': 'System',
+            'Priority': 'Medium'
         }])
+        error_df.attrs['parse_fallback'] = True
+        return error_df
+
+def parse_test_case_responses(responses):
+    """
+    Parses several LLM responses and merges their test cases into one DataFrame.
+    Test cases repeated across responses (e.g. from overlapping chunks) are dropped,
+    and IDs reused across responses get a -2, -3, ... suffix to stay unique.
+    Failed requests (exceptions from batch_test_case_chain) are skipped; if every
+    request failed, the first error is raised. Responses that could not be parsed
+    are dropped as well, unless none could be parsed, in which case their
+    placeholder rows are returned.
+    df.attrs['parse_fallback'] is True if any request failed or any response
+    could not be parsed.
+    """
+    failed = [response for response in responses if isinstance(response, Exception)]
+    for error in failed:
+        print(f"Skipping failed test case generation request: {error}")
+    responses = [response for response in responses if not isinstance(response, Exception)]
+    if failed and not responses:
+        raise failed[0]
+    
+    frames = [parse_test_cases_from_response(response) for response in responses]
+    parsed_frames = [frame for frame in frames if not frame.attrs.get('parse_fallback')]
+    parse_fallback = bool(failed) or len(parsed_frames) < len(frames)
+    df = pd.concat(parsed_frames or frames, ignore_index=True)
+    # Compare as text so any unhashable values left in these fields can't break the check
+    duplicated = df[['Test Case Title', 'Test Steps']].astype(str).duplicated()
+    df = df[~duplicated].reset_index(drop=True)
+    # Each chunk is numbered independently, so every response starts at TC001
+    ids = df['Test Case ID'].astype(str)
+    repeat = ids.groupby(ids).cumcount()
+    df['Test Case ID'] = ids.where(repeat == 0, ids + '-' + (repeat + 1).astype(str))
+    # concat falls back to object dtype when the per-response categories differ
+    df['Priority'] = _as_category(df['Priority'])
+    df['Module/Feature'] = _as_category(df['Module/Feature'])
+    df.attrs['parse_fallback'] = parse_fallback
+    return df
 
-def create_excel_file(test_cases_df):
+def create_excel_file(test_cases_df, out=None):
     """
     Create an Excel file with test cases in a professional format.
     Each test step gets its own row in Excel.
-    Returns the Excel file as bytes for download.
+    If a seekable, writable binary file (e.g. an open temporary file) is passed
+    as out, the workbook is written straight into it and out is returned;
+    otherwise returns the Excel file as bytes for download. out must be
+    seekable because a failed export is rewound and replaced by a plain sheet.
     """
     print(f"Creating Excel file with {len(test_cases_df)} test cases")
     
-    output = io.BytesIO()
+    output = io.BytesIO() if out is None else out
     
     try:
-        expanded_rows = []
+        # One row per non-empty step; case_pos maps each step back to its test case
+        steps = (
+            test_cases_df['Test Steps'].reset_index(drop=True)
+            .astype(str).str.split('\n').explode().str.strip()
+        )
+        steps = steps[steps.notna() & (steps != '')]
+        case_pos = steps.index.to_numpy()
+        steps = steps.reset_index(drop=True)
+        cases = test_cases_df.iloc[case_pos].reset_index(drop=True)
         
-        for idx, row in test_cases_df.iterrows():
-            test_steps = str(row['Test Steps']).split('\n')
-            test_steps = [step.strip() for step in test_steps if step.strip()]
-            
-            # Split expected results by step if LLM provided them
-            expected_results = str(row['Expected Result']).split('\n')
-            expected_results = [result.strip() for result in expected_results if result.strip()]
-            
-            for step_num, step in enumerate(test_steps, 1):
-                # Check if step requires visual confirmation and add screenshot instruction
-                step_expected_result = ''
-                if any(keyword in step.lower() for keyword in ['verify', 'check', 'confirm', 'validate', 'ensure', 'displayed', 'appears', 'shown', 'visible']):
-                    step_expected_result = '**Add screenshot here'
-                elif step_num == len(test_steps):
-                    step_expected_result = row['Expected Result']
-                
-                # If it's the last step and has verification keywords, append to existing result
-                if step_num == len(test_steps) and any(keyword in step.lower() for keyword in ['verify', 'check', 'confirm', 'validate', 'ensure', 'displayed', 'appears', 'shown', 'visible']):
-                    step_expected_result = '**Add screenshot here\n' + row['Expected Result']
-                
-                expanded_rows.append({
-                    'Test Case ID': row['Test Case ID'] if step_num == 1 else '',
-                    'Test Case Title': row['Test Case Title'] if step_num == 1 else '',
-                    'Description': row['Description'] if step_num == 1 else '',
-                    'Preconditions': row['Preconditions'] if step_num == 1 else '',
-                    'Step Number': step_num,
-                    'Test Step': step,
-                    'Expected Result': step_expected_result,
-                    'Screenshot': '',
-                    'Test Data': row['Test Data'] if step_num == 1 else ''
-                })
+        step_numbers = steps.groupby(case_pos).cumcount() + 1
+        is_first = step_numbers == 1
+        is_last = steps.groupby(case_pos).cumcount(ascending=False) == 0
         
-        expanded_df = pd.DataFrame(expanded_rows)
-        print(f"Expanded to {len(expanded_df)} rows")
+        # Steps that require visual confirmation get a screenshot instruction;
+        # the last step carries the overall expected result
+        has_keyword = steps.str.contains(_VERIFY_RE)
+        case_expected = cases['Expected Result'].astype(str).to_numpy(dtype=object)
+        step_expected = pd.Series(np.select(
+            [has_keyword & is_last, has_keyword, is_last],
+            ['**Add screenshot here\n' + case_expected, '**Add screenshot here', case_expected],
+            default=''
+        ), index=steps.index)
         
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            expanded_df.to_excel(writer, sheet_name='Test Cases', index=False)
-            
+        # Columns of the Test Cases sheet, streamed row by row into the workbook
+        expanded_columns = {
+            'Test Case ID': cases['Test Case ID'].where(is_first, ''),
+            'Test Case Title': cases['Test Case Title'].where(is_first, ''),
+            'Description': cases['Description'].where(is_first, ''),
+            'Preconditions': cases['Preconditions'].where(is_first, ''),
+            'Step Number': step_numbers,
+            'Test Step': steps,
+            'Expected Result': step_expected,
+            'Screenshot': pd.Series('', index=steps.index),
+            'Test Data': cases['Test Data'].where(is_first, '')
+        }
+        # Convert every column to text once, so rows need no per-cell checks
+        expanded_columns = {
+            col_name: values.fillna('').astype(str)
+            for col_name, values in expanded_columns.items()
+        }
+        num_steps = len(steps)
+        print(f"Expanded to {num_steps} rows")
+        
+        # constant_memory streams each row to disk once the next one starts,
+        # so every sheet below must be written strictly top to bottom.
+        # Step text is plain text: never turn it into formulas or numbers.
+        with pd.ExcelWriter(
+            output,
+            engine='xlsxwriter',
+            engine_kwargs={'options': {
+                'constant_memory': True,
+                'strings_to_formulas': False,
+                'strings_to_numbers': False,
+            }}
+        ) as writer:
             workbook = writer.book
-            worksheet = writer.sheets['Test Cases']
+            worksheet = workbook.add_worksheet('Test Cases')
+            worksheet.set_default_row(25)
             
-            header_format = workbook.add_format({
-                'bold': True,
-                'bg_color': '#0055a4',
-                'font_color': 'white',
-                'border': 1,
-                'align': 'center',
-                'valign': 'vcenter',
-                'text_wrap': True
-            })
-            
-            cell_format = workbook.add_format({
-                'border': 1,
-                'align': 'left',
-                'valign': 'top',
-                'text_wrap': True
-            })
-            
-            step_number_format = workbook.add_format({
-                'border': 1,
-                'align': 'center',
-                'valign': 'vcenter',
-                'bold': True
-            })
-            
-            column_widths = {
-                'Test Case ID': 15,
-                'Test Case Title': 35,
-                'Description': 40,
-                'Preconditions': 35,
-                'Step Number': 10,
-                'Test Step': 60,
-                'Expected Result': 40,
-                'Screenshot': 20,
-                'Test Data': 30
-            }
-            
-            for col_num, col_name in enumerate(expanded_df.columns):
-                worksheet.write(0, col_num, col_name, header_format)
-                worksheet.set_column(col_num, col_num, column_widths.get(col_name, 20))
-            
-            step_num_col = expanded_df.columns.get_loc('Step Number')
-            
-            for row_num in range(len(expanded_df)):
-                excel_row = row_num + 1
-                for col_num in range(len(expanded_df.columns)):
-                    cell_value = expanded_df.iloc[row_num, col_num]
-                    if pd.isna(cell_value):
-                        cell_value = ""
-                    else:
-                        cell_value = str(cell_value)
-                    
-                    fmt = step_number_format if col_num == step_num_col else cell_format
-                    worksheet.write(excel_row, col_num, cell_value, fmt)
-                
-                worksheet.set_row(excel_row, 25)
+            header_format = workbook.add_format(_HEADER_FMT_DICT)
+            cell_format = workbook.add_format(_CELL_FMT_DICT)
+            step_number_format = workbook.add_format(_STEP_FMT_DICT)
             
             worksheet.set_row(0, 30)
+            worksheet.write_row(0, 0, list(expanded_columns), header_format)
+            for col_num, width in enumerate(_COLUMN_WIDTHS):
+                worksheet.set_column(col_num, col_num, width)
             
-            summary_data = {
-                'Metric': ['Total Test Cases', 'Total Test Steps', 'Generated On'],
-                'Value': [len(test_cases_df), len(expanded_df), datetime.now().strftime('%Y-%m-%d %H:%M:%S')]
-            }
+            step_num_col = list(expanded_columns).index('Step Number')
             
-            summary_df = pd.DataFrame(summary_data)
-            summary_df.to_excel(writer, sheet_name='Summary', index=False)
+            for excel_row, row_values in enumerate(zip(*expanded_columns.values()), start=1):
+                worksheet.write_row(excel_row, 0, row_values, cell_format)
+                # Rewrite the step number cell with its own format; the row is
+                # still in memory, so this replaces rather than appends
+                worksheet.write_string(excel_row, step_num_col, row_values[step_num_col], step_number_format)
             
-            summary_worksheet = writer.sheets['Summary']
+            # pandas' to_excel writes column by column, which constant_memory
+            # would truncate, so the summary rows are written directly.
+            summary_worksheet = workbook.add_worksheet('Summary')
+            summary_worksheet.write_row(0, 0, ['Metric', 'Value'], header_format)
+            summary_worksheet.write_string(1, 0, 'Total Test Cases')
+            summary_worksheet.write_number(1, 1, len(test_cases_df))
+            summary_worksheet.write_string(2, 0, 'Total Test Steps')
+            summary_worksheet.write_number(2, 1, num_steps)
+            summary_worksheet.write_string(3, 0, 'Generated On')
+            summary_worksheet.write_string(3, 1, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
             summary_worksheet.set_column('A:A', 20)
             summary_worksheet.set_column('B:B', 30)
         
+        if out is not None:
+            print("Excel file created successfully")
+            return out
+        
         excel_data = output.getvalue()
         print(f"Excel file created successfully, size: {len(excel_data)} bytes")
         return excel_data
     
     except Exception as e:
         print(f"Error creating Excel file: {e}")
+        if out is not None:
+            # Discard whatever the failed writer left behind
+            out.seek(0)
+            out.truncate()
+            test_cases_df.to_excel(out, index=False)
+            return out
         simple_output = io.BytesIO()
         test_cases_df.to_excel(simple_output, index=False)
         return simple_output.getvalue()
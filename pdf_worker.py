@@ -0,0 +1,20 @@
+"""
+Page extraction helpers run inside the PDF worker processes.
+Kept apart from backend so a freshly started worker only has to import pypdf,
+not the LLM and pandas stack.
+"""
+import io
+
+from pypdf import PdfReader
+
+_worker_pdf_reader = None
+
+def init_pdf_worker(pdf_bytes):
+    """
+    Opens the PDF once per worker process so pages can be extracted by index.
+    """
+    global _worker_pdf_reader
+    _worker_pdf_reader = PdfReader(io.BytesIO(pdf_bytes))
+
+def extract_page_text(page_index):
+    return _worker_pdf_reader.pages[page_index].extract_text() or ""